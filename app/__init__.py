@@ -3,5 +3,7 @@ from flask import Flask
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
+# Detection model used by the routes, None uses the Roboflow model
+app.config['MODEL'] = None
 
 from app import routes
\ No newline at end of file
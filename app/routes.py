@@ -1,6 +1,9 @@
-from flask import request, send_file, render_template
+from flask import request, send_file, render_template, jsonify
+import io
 import os
-from main import process_image
+import tempfile
+from werkzeug.utils import secure_filename
+from main import process_image, analyze_image
 from app import app
 
 @app.route('/')
@@ -17,10 +20,44 @@ def upload_file():
     if file:
         upload_folder = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER']))
         output_folder = os.path.abspath(os.path.join(app.config['OUTPUT_FOLDER']))
-        input_path = os.path.join(upload_folder, file.filename)
-        output_path = os.path.join(output_folder, 'output.jpg')
-        file.save(input_path)
-        
-        process_image(input_path, output_path)
-        
-        return send_file(output_path, mimetype='image/jpeg')
\ No newline at end of file
+        # Requests are processed concurrently, so each one reads and writes its own files
+        handle, input_path = tempfile.mkstemp(suffix=os.path.splitext(secure_filename(file.filename))[1], dir=upload_folder)
+        os.close(handle)
+        handle, output_path = tempfile.mkstemp(suffix='.jpg', dir=output_folder)
+        os.close(handle)
+        try:
+            file.save(input_path)
+            process_image(input_path, output_path, app.config['MODEL'])
+            with open(output_path, 'rb') as output_file:
+                output = io.BytesIO(output_file.read())
+        finally:
+            os.remove(input_path)
+            os.remove(output_path)
+
+        return send_file(output, mimetype='image/jpeg')
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_files():
+    files = [file for file in request.files.getlist('file') if file.filename != '']
+    if not files:
+        return jsonify({"error": "No selected file"}), 400
+
+    upload_folder = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER']))
+    results = []
+    for file in files:
+        filename = secure_filename(file.filename)
+        # Every upload gets its own file so concurrent requests never read each other's base
+        handle, input_path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1], dir=upload_folder)
+        os.close(handle)
+        try:
+            file.save(input_path)
+            result = analyze_image(input_path, app.config['MODEL'])
+        except Exception as error:
+            # One bad base should not discard the results of the rest of the batch
+            result = {"error": str(error)}
+        finally:
+            os.remove(input_path)
+        result["filename"] = filename
+        results.append(result)
+
+    return jsonify({"results": results})
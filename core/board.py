@@ -1,32 +1,41 @@
 import numpy as np
 import os
 from math import sqrt
-from scipy.spatial import KDTree
-from core.building import Building
+from core.building import BuildingTable
 from core.graph import Graph
 from core.model import ModelInference
 from core.imageTransform import ImageTransformer
+from core.detectionFilter import DetectionFilter
 
-def initialize_board(base_image_path):
+def initialize_board(base_image_path, model=None):
     """ Initializes the board with buildings and returns the board and graph.
     :param str base_image_path: path to the base image
-    :type str
-    :rtype 2D array, Graph, dict
-    :return 44x44 string array, graph of buildings, json output from the model"""
-    board = create_board()
-    api_key = os.getenv("ROBOFLOW_API_KEY")
-    model = ModelInference(api_key)
+    :param ModelInference model: model used for detection, defaults to the Roboflow model
+    :type str, ModelInference
+    :rtype 2D array, Graph, dict, BuildingTable
+    :return 44x44 string array, graph of building indices, cleaned json output from the model, table of buildings"""
+    if model is None:
+        api_key = os.getenv("ROBOFLOW_API_KEY")
+        model = ModelInference(api_key)
 
     output = model.get_inference_output(base_image_path)
-    transformer = ImageTransformer()
-    transformer.create_building_list(output)
+    return build_board(output)
 
-    for building in Building.building_list:
-        insert_building(board, building)
+def build_board(output):
+    """ Builds the board and graph from the json output of the model.
+    :param dict output: json output from the model
+    :type dict
+    :rtype 2D array, Graph, dict, BuildingTable
+    :return 44x44 string array, graph of building indices, cleaned json output from the model, table of buildings"""
+    board = create_board()
+    output = DetectionFilter().apply(output)
+    transformer = ImageTransformer()
+    table = transformer.create_building_table(output)
 
-    graph = create_graph(board, Building.building_list)
+    insert_buildings(board, table)
+    graph = create_graph(table)
 
-    return board, graph, output
+    return board, graph, output, table
 
 def create_board():
     """ Returns a new Clash of Clans board in form of 44x44 array.
@@ -39,28 +48,42 @@ def create_board():
     board = np.full((44, 44), ".", dtype=str) # For better alignment, print board only shows the 1st character as opposed to 'U3'
     return board
 
-def create_graph(board, buildings):
-    """ Builds a graph of buildings and their adjacencies.
-    :param 2D array board: 44x44 array of Building objects or None
-    :param list buildings: list of Building objects
+def create_graph(table):
+    """ Builds a graph of building indices and their adjacencies, checking every pair at once.
+    :param BuildingTable table: table of buildings
     :rtype Graph
-    :return graph: graph of buildings
+    :return graph: graph of building indices
     """
     graph = Graph()
-    for building in buildings:
-        graph.add_node(building)
-    coordinates = [building.top_left_coordinates for building in buildings]
-    kd_tree = KDTree(coordinates)
-
-    for i, building in enumerate(buildings):
-        coords = building.top_left_coordinates
-        indices = kd_tree.query_ball_point(coords, sqrt(72), return_sorted=True)
-        for index in indices:
-            if index != i:
-                if(are_buildings_adjacent(building, buildings[index])):
-                    if (buildings[index], 0) not in graph.get_neighbors(building):
-                        distance = find_distance(building, buildings[index])
-                        graph.add_edge(building, buildings[index], distance)
+    indices = table.alive_indices()
+    for index in indices.tolist():
+        graph.add_node(index)
+
+    row = table.row[indices].astype(np.int32)
+    col = table.col[indices].astype(np.int32)
+    length = table.length[indices].astype(np.int32)
+    row1, row2 = row[:, None], row[None, :]
+    col1, col2 = col[:, None], col[None, :]
+    length1, length2 = length[:, None], length[None, :]
+
+    # Two buildings are adjacent when their footprints are at most one tile apart and their top-left corners are close.
+    # Touching buildings are at distance -(# of tiles touching), others at the Euclidean distance between their footprints.
+    left = col1 < col2
+    above = row1 < row2
+    horizontal_check = np.where(left, col1 + length1 + 1 >= col2, col2 + length2 + 1 >= col1)
+    vertical_check = np.where(above, row1 + length1 + 1 >= row2, row2 + length2 + 1 >= row1)
+    in_range = (row1 - row2) ** 2 + (col1 - col2) ** 2 <= 72
+    adjacent = horizontal_check & vertical_check & in_range
+    np.fill_diagonal(adjacent, False)
+
+    horizontal_gap = np.where(left, col2 - (col1 + length1), col1 - (col2 + length2))
+    vertical_gap = np.where(above, row2 - (row1 + length1), row1 - (row2 + length2))
+    touching = (horizontal_gap < 0) & (vertical_gap <= 0) | (vertical_gap < 0) & (horizontal_gap <= 0)
+    distance = np.where(touching, horizontal_gap + vertical_gap,
+                        np.hypot(np.maximum(horizontal_gap, 0), np.maximum(vertical_gap, 0)))
+
+    for i, j in np.argwhere(adjacent).tolist():
+        graph.add_edge(int(indices[i]), int(indices[j]), distance[i, j].item())
     return graph
 
 def print_board(board):
@@ -73,99 +96,27 @@ def print_board(board):
     for row in board:
         print(" ".join(row))
 
-def insert_building(board, building):
-    """ Inserts a building into the board.
+def insert_buildings(board, table):
+    """ Inserts every alive building of a table into the board.
     :param 2D array board: 44x44 string array
-    :param Building building: building to insert
-    :type 2D array, Building
+    :param BuildingTable table: table of buildings
+    :type 2D array, BuildingTable
     :rtype void
     :return None
     """
-    row, col = building.top_left_coordinates
-    length = int(sqrt(building.size))
-    for i in range(row, row + length):
-        for j in range(col, col + length):
-            board[i][j] = str(building)
-
-def find_building(board, building):
-    """ Returns a list of all buildings in the board.
-    :param 2D array board: 44x44 string array
-    :param Building building: building to find
-    :type 2D array, Building
-    :rtype Building
-    :return buildings: Building object if found, None otherwise
-    """
-    for b in Building.building_list:
-        if building == b:
-            return b
-    return None
-
-def find_distance(building1, building2):
-    """ Returns the distance between two buildings.
-    :param Building building1: first building
-    :param Building building2: second building
-    :type Building, Building
-    :rtype float
-    :return distance: distance between two buildings. If the two are direct neighbors (have touching tiles), return # of tiles touching, else return the Euclidean distance between the two buildings
-    """
-    row1, col1 = building1.top_left_coordinates
-    length1 = int(sqrt(building1.size))
-    row2, col2 = building2.top_left_coordinates
-    length2 = int(sqrt(building2.size))
-
-    horizontal_distance = col1 - col2
-    vertical_distance = row1 - row2
-    actual_horizontal_distance, actual_vertical_distance = None, None
-
-    if(horizontal_distance < 0):
-        actual_horizontal_distance = col2 - (col1 + length1)
-    else:
-        actual_horizontal_distance = col1 - (col2 + length2)
-    if(vertical_distance < 0):
-        actual_vertical_distance = row2 - (row1 + length1)
-    else:
-        actual_vertical_distance = row1 - (row2 + length2)
-    
-    if actual_horizontal_distance < 0 and actual_vertical_distance <= 0 or actual_vertical_distance < 0 and actual_horizontal_distance <= 0:
-        return actual_vertical_distance + actual_horizontal_distance
-    else:
-        if actual_horizontal_distance < 0:
-            actual_horizontal_distance = 0
-        if actual_vertical_distance < 0:
-            actual_vertical_distance = 0
-        return sqrt(actual_horizontal_distance ** 2 + actual_vertical_distance ** 2)
-
-def find_nearest_neighbor(building, graph):
-    """ Returns the nearest neighbor of a building.
-    :param Building building: building to find the nearest neighbor of
-    :param Graph graph: graph of buildings
-    :type Building, Graph
-    :rtype Building
-    :return nearest_neighbor: nearest neighbor of the building
-    """
-    neighbors = graph.get_neighbors(building)
-    nearest_neighbor = None
-    min_distance = sqrt(44**2 + 44**2)
-    for neighbor in neighbors:
-        if neighbor[1] < min_distance:
-            min_distance = neighbor[1]
-            nearest_neighbor = neighbor[0]
-        elif neighbor[1] == min_distance:
-            if nearest_neighbor != None and (neighbor[0]).health > nearest_neighbor.health:
-                nearest_neighbor = neighbor[0]
-            if nearest_neighbor == None:
-                nearest_neighbor = neighbor[0]
-    print(building, nearest_neighbor)
-    return nearest_neighbor
+    for index in table.alive_indices().tolist():
+        row, col, length = int(table.row[index]), int(table.col[index]), int(table.length[index])
+        board[row:row + length, col:col + length] = table.labels[index]
 
-def find_nearest_neighbor_not_visited(building, graph, visited):
+def find_nearest_neighbor_not_visited(building, graph, visited, health):
     """ Returns the nearest neighbor of a building that has not been visited.
-    :param Building building: building to find the nearest neighbor of
-    :param Graph graph: graph of buildings
-    :param set visited: set of visited buildings
-    :type Building, Graph, set
-    :rtype Building
-    :return nearest_neighbor: nearest neighbor of the building that has not been visited
+    :param int building: index of the building to find the nearest neighbor of
+    :param Graph graph: graph of building indices
+    :param set visited: set of visited building indices
+    :param array health: health of every building, ties go to the healthier neighbor
+    :type int, Graph, set, array
+    :rtype int
+    :return nearest_neighbor: index of the nearest neighbor of the building that has not been visited
     """
     neighbors = graph.get_neighbors(building)
     nearest_neighbor = None
@@ -175,52 +126,31 @@ def find_nearest_neighbor_not_visited(building, graph, visited):
             min_distance = neighbor[1]
             nearest_neighbor = neighbor[0]
         elif neighbor[0] not in visited and neighbor[1] == min_distance:
-            if nearest_neighbor != None and (neighbor[0]).health > nearest_neighbor.health and neighbor[0] not in visited:
+            if nearest_neighbor != None and health[neighbor[0]] > health[nearest_neighbor] and neighbor[0] not in visited:
                 nearest_neighbor = neighbor[0]
             if nearest_neighbor == None and neighbor[0] not in visited:
                 nearest_neighbor = neighbor[0]
     return nearest_neighbor
 
-def are_buildings_adjacent(building1, building2):
-    """ Returns True if two buildings are adjacent, False otherwise.
-    :param Building building1: first building
-    :param Building building2: second building
-    :type Building, Building
-    :rtype bool
-    :return True if buildings are adjacent, False otherwise
+def group_buildings(graph, table):
+    """ Returns the chain an Electro Dragon would follow from every alive building, longest first.
+    :param Graph graph: graph of building indices
+    :param BuildingTable table: table of buildings
+    :type Graph, BuildingTable
+    :rtype list
+    :return sorted_chains: list of (chain of building indices, chain length) tuples
     """
-    row1, col1 = building1.top_left_coordinates
-    length1 = int(sqrt(building1.size))
-    row2, col2 = building2.top_left_coordinates
-    length2 = int(sqrt(building2.size))
-
-    horizontal_distance = col1 - col2
-    vertical_distance = row1 - row2
-    horizontal_check, vertical_check = False, False
-
-    if(horizontal_distance < 0):
-        horizontal_check = col1 + length1 + 1 >= col2
-    else:
-        horizontal_check = col2 + length2 + 1 >= col1
-    if(vertical_distance < 0):
-        vertical_check = row1 + length1 + 1>= row2
-    else:
-        vertical_check = row2 + length2 + 1>= row1
-
-    return horizontal_check and vertical_check
-
-def group_buildings(graph, buildings):
     chains = []
 
     def dfs(visited, node, chain, counter):
-        next = find_nearest_neighbor_not_visited(node, graph, visited)
+        next = find_nearest_neighbor_not_visited(node, graph, visited, table.health)
         if next is not None and next not in visited:
             visited.add(next)
             counter[0] += 1
             chain.append(next)
             dfs(visited, next, chain, counter)
     
-    for building in buildings:
+    for building in table.alive_indices().tolist():
         chain = [building]
         counter = [1]
         visited = set()
@@ -231,54 +161,32 @@ def group_buildings(graph, buildings):
     sorted_chains = sorted(chains, key=lambda x: x[1], reverse=True)
     return sorted_chains
 
-def find_adjacent_buildings(board, buildings):
-    """ Builds a graph of buildings and their adjacencies.
-    :param 2D array board: 44x44 array of Building objects or None
-    :param list buildings: list of Building objects
-    :rtype Graph
-    :return graph: graph of buildings
-    """
-    graph = Graph()
-    for building in buildings:
-        graph.add_node(building)
-        row, col = building.center_coordinates
-        if row > 0 and board[row - 1][col] is not None:
-            graph.add_edge(building, board[row - 1][col])
-        if row < 43 and board[row + 1][col] is not None:
-            graph.add_edge(building, board[row + 1][col])
-        if col > 0 and board[row][col - 1] is not None:
-            graph.add_edge(building, board[row][col - 1])
-        if col < 43 and board[row][col + 1] is not None:
-            graph.add_edge(building, board[row][col + 1])
-    return graph
-
-def eliminate_building(graph, board, building):
-    """ Eliminates a building from the board.
+def eliminate_building(graph, board, table, index):
+    """ Eliminates a building of a table from the board.
+    :param Graph graph: graph of building indices
     :param 2D array board: 44x44 string array
-    :param Building building: building to eliminate
-    :type 2D array, Building
+    :param BuildingTable table: table of buildings
+    :param int index: index of the building to eliminate
+    :type Graph, 2D array, BuildingTable, int
     :rtype void
     :return None
     """
-    row, col = building.top_left_coordinates
-    length = int(sqrt(building.size))
-    for i in range(row, row + length):
-        for j in range(col, col + length):
-            board[i][j] = "X"
-    Building.delete(building)
-    graph.delete_node(building)
+    row, col, length = int(table.row[index]), int(table.col[index]), int(table.length[index])
+    board[row:row + length, col:col + length] = "X"
+    table.alive[index] = False
+    graph.delete_node(index)
 
-def find_surrounding_tiles(board, building):
+def find_surrounding_tiles(board, table, index):
     """ Returns a list of all surrounding tiles of a building.
     :param 2D array board: 44x44 string array
-    :param Building building: building to find the surrounding tiles of
-    :type 2D array, Building
+    :param BuildingTable table: table of buildings
+    :param int index: index of the building to find the surrounding tiles of
+    :type 2D array, BuildingTable, int
     :rtype list
     :return surrounding_tiles: list of all surrounding tiles of the building
     """
 
-    row, col = building.top_left_coordinates
-    length = int(sqrt(building.size))
+    row, col, length = int(table.row[index]), int(table.col[index]), int(table.length[index])
     surrounding_tiles = []
     for i in range(row - 3, row + length + 3):
         for j in range(col - 3, col + length + 3):
@@ -315,20 +223,24 @@ def valid_tile(board, row, col):
         return False
     return True  
 
-def place_electro_dragons(board, chains, num_dragons):
+def place_electro_dragons(board, chains, num_dragons, table):
     """ Places Electro Dragons on non-overlapping valid tiles with highest chain rate.
     :param 2D array board: 44x44 string array
-    :param list chains: list of chains of buildings
+    :param list chains: list of chains of building indices
     :param int num_dragons: number of Electro Dragons to place
-    :type 2D array, list, int
+    :param BuildingTable table: table of buildings
+    :type 2D array, list, int, BuildingTable
     :rtype list
     :return list of Electro Dragons placed on the board
     """
     visited = set()
     dragons = []
-    while num_dragons > 0:
-        if(len(Building.building_list) == len(visited)):
+    while num_dragons > 0 and chains:
+        # group_buildings starts one chain from every building
+        if(len(chains) == len(visited)):
             visited = set()
+        fresh_pass = len(visited) == 0
+        placed = num_dragons
         for chain in chains:
             starting_building = chain[0][0]
             if(starting_building not in visited):
@@ -336,12 +248,13 @@ def place_electro_dragons(board, chains, num_dragons):
                     next_building = starting_building   
                 else:
                     next_building = chain[0][1]
-                surrounding_tiles = find_surrounding_tiles(board, starting_building)
+                surrounding_tiles = find_surrounding_tiles(board, table, starting_building)
+                next_row, next_col = int(table.row[next_building]), int(table.col[next_building])
                 best_tile = None
                 best_distance = None
                 for i, j in surrounding_tiles:
                     if valid_tile(board, i, j):
-                        distance = sqrt((i - next_building.top_left_coordinates[0])**2 + (j - next_building.top_left_coordinates[1])**2)
+                        distance = sqrt((i - next_row)**2 + (j - next_col)**2)
                         if best_tile is None or distance < best_distance:
                             best_tile = (i,j)
                             best_distance = distance
@@ -354,22 +267,77 @@ def place_electro_dragons(board, chains, num_dragons):
                     visited.add(building)
             if num_dragons == 0:
                 return dragons
+        if fresh_pass and placed == num_dragons:
+            # No building has a valid tile left around it
+            return dragons
+    return dragons
 
-def process_dragons(board, graph, output, buildings, base_image_path, output_image_path):
+def process_dragons(board, graph, output, table, base_image_path, output_image_path):
     """ Processes the Electro Dragons and overlays them on the base image.
     :param 2D array board: 44x44 string array
-    :param Graph graph: graph of buildings
+    :param Graph graph: graph of building indices
     :param dict output: json output from the model
-    :param list buildings: list of Building objects
+    :param BuildingTable table: table of buildings
     :param str base_image_path: path to the base image
     :param str output_image_path: path to the output image
-    :type 2D array, Graph, dict, list, str, str
+    :type 2D array, Graph, dict, BuildingTable, str, str
     :rtype void
     :return None
     """
     transformer = ImageTransformer()
-    chains = group_buildings(graph, buildings)
-    dragons = place_electro_dragons(board, chains, 6)
-    dragons = transformer.unrotate_coordinates(output, dragons)
+    _, _, dragons = find_dragon_positions(board, graph, output, table)
     transformer.overlay_dragons_on_image(base_image_path, dragons, output_image_path)
 
+def find_dragon_positions(board, graph, output, table, num_dragons=6):
+    """ Finds the Electro Dragon positions without touching the base image.
+    :param 2D array board: 44x44 string array
+    :param Graph graph: graph of building indices
+    :param dict output: json output from the model
+    :param BuildingTable table: table of buildings
+    :param int num_dragons: number of Electro Dragons to place
+    :type 2D array, Graph, dict, BuildingTable, int
+    :rtype list, list, list
+    :return chains of building indices, dragon tiles on the 44x44 grid, dragon coordinates in image pixels
+    """
+    transformer = ImageTransformer()
+    chains = group_buildings(graph, table)
+    tiles = place_electro_dragons(board, chains, num_dragons, table)
+    pixels = transformer.unrotate_coordinates(output, tiles)
+    return chains, tiles, pixels
+
+# Building names sent to API clients, by type code; the internal "Labratory" spelling is not exposed
+API_TYPE_NAMES = [{"Labratory": "Laboratory"}.get(name, name) for name in BuildingTable.TYPE_NAMES]
+
+def summarize_layout(output, table, chains, tiles, pixels):
+    """ Summarizes a processed base as json-serializable data.
+    :param dict output: cleaned json output from the model
+    :param BuildingTable table: table of buildings
+    :param list chains: chains of building indices
+    :param list tiles: dragon tiles on the 44x44 grid
+    :param list pixels: dragon coordinates in image pixels
+    :type dict, BuildingTable, list, list, list
+    :rtype dict
+    :return buildings, chains, grid dragon tiles, pixel dragon coordinates and dropped detections
+    """
+    return {
+        "image": {"width": output["image"]["width"], "height": output["image"]["height"]},
+        "buildings": [
+            {
+                "label": table.labels[index],
+                "name": API_TYPE_NAMES[table.type_code[index]],
+                "size": int(table.length[index]) ** 2,
+                "health": int(table.health[index]),
+                "top_left": [int(table.row[index]), int(table.col[index])]
+            }
+            for index in table.alive_indices().tolist()
+        ],
+        "chains": [
+            {"buildings": [table.labels[index] for index in chain], "length": length}
+            for chain, length in chains
+        ],
+        "dragons": {
+            "tiles": [[int(row), int(col)] for row, col in tiles],
+            "pixels": [[float(x), float(y)] for x, y in pixels]
+        },
+        "dropped": output["postprocessing"]["dropped"]
+    }
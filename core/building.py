@@ -1,7 +1,9 @@
+import numpy as np
+from math import sqrt
+
+
 class Building:
-    id_counter = 0
-    instance_counts = {}
-    building_list = []
+    """ Catalog of building types. The buildings of a base are stored in a BuildingTable. """
     BUILDING_TYPES = {
         "Bomb" : 1,
         "Hut" : 4,
@@ -39,7 +41,7 @@ class Building:
         "Bomb": 73,
         "Hut": 250,
         "Cannon": 420,
-        "Laboratory": 500,
+        "Labratory": 500,
         "ArcherTower": 380,
         "Mortar": 400,
         "ClanCastle": 1200,
@@ -51,52 +53,119 @@ class Building:
         "ArmyCamp": 150,
         "TownHall": 1600
     }
-    def __init__(self, size, name, top_left_coordinates):
+
+
+class BuildingTable:
+    """ Column-oriented storage for the buildings of one base. Entry i of every column describes building i. """
+    TYPE_NAMES = list(Building.BUILDING_TYPES)
+    TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+    TYPE_LENGTHS = np.array([int(sqrt(Building.BUILDING_TYPES[name])) for name in TYPE_NAMES], dtype=np.int8)
+    TYPE_HEALTH = np.array([Building.BUILDING_HEALTH.get(name, 0) for name in TYPE_NAMES], dtype=np.int32)
+
+    def __init__(self, type_codes, rows, cols):
         """
-        Initializes a new Building instance.
-        
-        :param int size: The size of the building (e.g., 4, 9, 16)
-        :param str name: The name of the building
-        :param tuple top_left_coordinates: The (x, y) coordinates of the building's top-left corner
+        Initializes a new BuildingTable from parallel columns.
+
+        :param array type_codes: Type code of every building, indexing TYPE_NAMES
+        :param array rows: Row of every building's top-left corner
+        :param array cols: Column of every building's top-left corner
         """
-        self.size = size
-        self.name = name
-        self.top_left_coordinates = top_left_coordinates
-        self.health = self.BUILDING_HEALTH.get(name, 0)
-        Building.building_list.append(self)
+        self.type_code = np.asarray(type_codes, dtype=np.int8)
+        self.row = np.asarray(rows, dtype=np.int16)
+        self.col = np.asarray(cols, dtype=np.int16)
+        self.length = self.TYPE_LENGTHS[self.type_code]
+        self.health = self.TYPE_HEALTH[self.type_code]
+        self.alive = np.ones(len(self.type_code), dtype=bool)
+        self.labels = self._create_labels()
 
-        if name in Building.instance_counts:
-            Building.instance_counts[name] += 1
-            self.id = Building.instance_counts[name]
-        else:
-            Building.instance_counts[name] = 1
-            self.id = 1
+    @classmethod
+    def from_names(cls, names, top_left_coordinates):
+        """
+        Alternative constructor using building names.
 
+        :param list names: The name of every building
+        :param list top_left_coordinates: The (row, col) coordinates of every building's top-left corner
+        :return: A new BuildingTable
+        :rtype: BuildingTable
+        """
+        type_codes = []
+        for name in names:
+            if name not in cls.TYPE_CODES:
+                raise ValueError(f"Unknown building type: {name}")
+            type_codes.append(cls.TYPE_CODES[name])
+        coordinates = np.asarray(top_left_coordinates, dtype=np.int16).reshape(-1, 2)
+        return cls(type_codes, coordinates[:, 0], coordinates[:, 1])
 
-    @classmethod
-    def from_type(cls, building_type, top_left_coordinates):
+    def _create_labels(self):
+        """ Creates the short board labels, numbering a type only when it occurs more than once
+        :rtype list
+        :return: Label of every building, for example "CA_2" or "TH"
         """
-        Alternative constructor to initialize a Building instance using a building type.
-        
-        :param str building_type: The type of the building (e.g., "small", "medium", "large")
-        :param str name: The name of the building
-        :param tuple top_left_coordinates: The (x, y) coordinates of the building's top-left corner
-        :return: A new Building instance
-        :rtype: Building
+        totals = np.bincount(self.type_code, minlength=len(self.TYPE_NAMES))
+        seen = [0] * len(self.TYPE_NAMES)
+        labels = []
+        for code in self.type_code.tolist():
+            seen[code] += 1
+            name = self.TYPE_NAMES[code]
+            short_name = Building.NAME_SHORTCUTS.get(name, name[0:2])
+            labels.append(f"{short_name}_{seen[code]}" if totals[code] > 1 else short_name)
+        return labels
+
+    def __len__(self):
+        return len(self.type_code)
+
+    def alive_indices(self):
+        """ Returns the indices of the buildings that have not been eliminated
+        :rtype array
+        :return: Indices of alive buildings
+        """
+        return np.flatnonzero(self.alive)
+
+    def view(self, index):
+        """ Returns an object view of a single building
+        :param int index: Index of the building
+        :rtype BuildingView
+        :return: View of the building
         """
-        size = cls.BUILDING_TYPES.get(building_type)
-        if size is None:
-            raise ValueError(f"Unknown building type: {building_type}")
-        return cls(size, building_type, top_left_coordinates)
+        return BuildingView(self, index)
 
-    def delete(self):
-        """ Deletes the building from the game
+    def views(self):
+        """ Returns object views of every alive building
+        :rtype list
+        :return: List of BuildingView objects
         """
-        Building.building_list.remove(self)
-        Building.instance_counts[self.name] -= 1
+        return [BuildingView(self, index) for index in self.alive_indices().tolist()]
+
+
+class BuildingView:
+    """ Read-only Building-like view of one entry in a BuildingTable. """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = int(index)
+
+    @property
+    def name(self):
+        return BuildingTable.TYPE_NAMES[self.table.type_code[self.index]]
+
+    @property
+    def size(self):
+        return int(self.table.length[self.index]) ** 2
+
+    @property
+    def top_left_coordinates(self):
+        return int(self.table.row[self.index]), int(self.table.col[self.index])
+
+    @property
+    def health(self):
+        return int(self.table.health[self.index])
+
+    def __eq__(self, other):
+        return isinstance(other, BuildingView) and self.table is other.table and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
 
     def __repr__(self):
-        short_name = self.NAME_SHORTCUTS.get(self.name, self.name[0:2])
-        if Building.instance_counts[self.name] > 1:
-            return f"{short_name}_{self.id}" # for example, "TH_0", help for debugging
-        return f"{short_name}"
\ No newline at end of file
+        return self.table.labels[self.index]
@@ -0,0 +1,139 @@
+import numpy as np
+from core.building import BuildingTable
+from core.imageTransform import ImageTransformer
+
+
+class DetectionFilter:
+    CONFIDENCE_THRESHOLD = 0.4
+    IOU_THRESHOLD = 0.5
+
+    def __init__(self, confidence_threshold=CONFIDENCE_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+        """
+        Initializes a new DetectionFilter.
+
+        :param float confidence_threshold: Predictions below this confidence are dropped
+        :param float iou_threshold: Predictions of the same class overlapping a more confident one by more than this are dropped
+        """
+        self.confidence_threshold = confidence_threshold
+        self.iou_threshold = iou_threshold
+        self.transformer = ImageTransformer()
+
+    @staticmethod
+    def suppress(order, conflicts):
+        """ Greedily keeps predictions in the given order, dropping every later prediction that conflicts with a kept one
+        :param order: Indices of the candidate predictions, most confident first
+        :param conflicts: Square boolean matrix, True where two predictions conflict
+        :type array, array
+        :rtype array
+        :return: Index of the kept prediction that suppressed each prediction, -1 if it was kept
+        """
+        suppressed_by = np.full(len(conflicts), -1)
+        alive = np.zeros(len(conflicts), dtype=bool)
+        alive[order] = True
+        for i in order.tolist():
+            if not alive[i]:
+                continue
+            losers = conflicts[i] & alive
+            losers[i] = False
+            suppressed_by[losers] = i
+            alive &= ~losers
+        return suppressed_by
+
+    def box_iou(self, predictions):
+        """ Computes the intersection over union of every pair of prediction boxes
+        :param predictions: List of predictions from the model
+        :type list
+        :rtype array
+        :return: Square matrix of IoU values
+        """
+        x = np.array([prediction["x"] for prediction in predictions], dtype=float)
+        y = np.array([prediction["y"] for prediction in predictions], dtype=float)
+        width = np.array([prediction["width"] for prediction in predictions], dtype=float)
+        height = np.array([prediction["height"] for prediction in predictions], dtype=float)
+        x1, y1, x2, y2 = x - width / 2, y - height / 2, x + width / 2, y + height / 2
+
+        overlap_x = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+        overlap_y = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+        intersection = overlap_x * overlap_y
+        area = width * height
+        union = area[:, None] + area[None, :] - intersection
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    def footprint_conflicts(self, data, type_codes):
+        """ Finds the predictions whose footprints leave the 44x44 grid or overlap each other
+        :param data: json data containing the image and predictions
+        :param type_codes: BuildingTable type code of every prediction
+        :type dict, array
+        :rtype array, array
+        :return: Boolean mask of out of bounds predictions, square boolean matrix of overlapping footprints
+        """
+        rows, cols = self.transformer.grid_coordinates(data)
+        rows, cols = rows.astype(np.int32), cols.astype(np.int32)
+        length = BuildingTable.TYPE_LENGTHS[type_codes].astype(np.int32)
+        out_of_bounds = (rows < 0) | (cols < 0) | (rows + length > 44) | (cols + length > 44)
+        overlap = ((rows[:, None] < rows[None, :] + length[None, :]) & (rows[None, :] < rows[:, None] + length[:, None]) &
+                   (cols[:, None] < cols[None, :] + length[None, :]) & (cols[None, :] < cols[:, None] + length[:, None]))
+        return out_of_bounds, overlap
+
+    def apply(self, data):
+        """ Cleans the model output so that every building is detected once and occupies its own tiles
+        :param data: json data containing the image and predictions
+        :type dict
+        :rtype dict
+        :return: Copy of the json data with only the kept predictions, and a "postprocessing" report of what was dropped
+        """
+        predictions = data["predictions"]
+        count = len(predictions)
+        reasons = [None] * count
+        conflicts_with = [None] * count
+
+        def drop(indices, reason, winners=None):
+            for position, index in enumerate(indices.tolist()):
+                reasons[index] = reason
+                if winners is not None:
+                    conflicts_with[index] = int(winners[position])
+
+        names = [self.transformer.conversion_dict.get(prediction["class"]) for prediction in predictions]
+        type_codes = np.array([BuildingTable.TYPE_CODES.get(name, -1) for name in names], dtype=np.int64)
+        confidence = np.array([prediction.get("confidence", 1.0) for prediction in predictions], dtype=float)
+        drop(np.flatnonzero(type_codes < 0), "unknown_class")
+        drop(np.flatnonzero((type_codes >= 0) & (confidence < self.confidence_threshold)), "low_confidence")
+        candidates = np.array([reason is None for reason in reasons], dtype=bool)
+
+        # Most confident first, ties keep the model's order
+        order = np.argsort(-confidence, kind="stable")
+
+        same_class = type_codes[:, None] == type_codes[None, :]
+        duplicates = same_class & (self.box_iou(predictions) > self.iou_threshold)
+        suppressed_by = self.suppress(order[candidates[order]], duplicates)
+        losers = np.flatnonzero(suppressed_by >= 0)
+        drop(losers, "duplicate", suppressed_by[losers])
+        candidates[losers] = False
+
+        # The grid is centered on the kept predictions, so dropping one can move the others; repeat until stable
+        while True:
+            kept = np.flatnonzero(candidates)
+            kept_data = dict(data, predictions=[predictions[index] for index in kept.tolist()])
+            out_of_bounds, overlap = self.footprint_conflicts(kept_data, type_codes[kept])
+            if out_of_bounds.any():
+                drop(kept[out_of_bounds], "out_of_bounds")
+                candidates[kept[out_of_bounds]] = False
+                continue
+            suppressed_by = self.suppress(np.argsort(-confidence[kept], kind="stable"), overlap)
+            losers = np.flatnonzero(suppressed_by >= 0)
+            if len(losers) == 0:
+                break
+            drop(kept[losers], "footprint_conflict", kept[suppressed_by[losers]])
+            candidates[kept[losers]] = False
+
+        dropped = [
+            {
+                "index": index,
+                "class": predictions[index]["class"],
+                "confidence": float(confidence[index]),
+                "reason": reasons[index],
+                "conflicts_with": conflicts_with[index]
+            }
+            for index in range(count) if reasons[index] is not None
+        ]
+        return dict(kept_data, postprocessing={"input": count, "kept": len(kept), "dropped": dropped})
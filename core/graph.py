@@ -5,7 +5,7 @@ class Graph:
     def add_node(self, node):
         """ Add a node to the graph. 
         :param node: The node to add
-        :type node: Building
+        :type node: int
         """
         if node not in self.adjacency_dict:
             self.adjacency_dict[node] = set()
@@ -15,8 +15,8 @@ class Graph:
         :param node1: The first node
         :param node2: The second node
         :param distance: The distance between the two nodes
-        :type node1: Building
-        :type node2: Building
+        :type node1: int
+        :type node2: int
         :type distance: float
         """
         if node1 in self.adjacency_dict and node2 in self.adjacency_dict:
@@ -28,7 +28,7 @@ class Graph:
     def get_neighbors(self, node):
         """ Get the neighbors of a node.
         :param node: The node to get the neighbors of
-        :type node: Building
+        :type node: int
         :rtype set
         :return: The neighbors of the node
         """
@@ -37,7 +37,7 @@ class Graph:
     def delete_node(self, node):
         """ Delete a node from the graph.
         :param node: The node to delete
-        :type node: Building
+        :type node: int
         :rtype void
         :return None
         """
@@ -1,8 +1,9 @@
 import math
 import json
 import os
+import numpy as np
 from PIL import Image, ImageDraw
-from core.building import Building
+from core.building import BuildingTable
 
 
 class ImageTransformer:
@@ -65,41 +66,49 @@ class ImageTransformer:
 
         return min_x, min_y, max_x, max_y
 
-    def create_building_list(self, data):
-        """ Create a list of Building objects from the json data, converting coordinates to a 44x44 grid
+    def create_building_table(self, data):
+        """ Create a BuildingTable from the json data, converting all coordinates to the 44x44 grid at once
         :param data: json data containing the image and predictions
         :type dict
-        :rtype list
-        :return: List of Building objects
+        :rtype BuildingTable
+        :return: BuildingTable with one entry per prediction, in prediction order
         """
-        building_list = []
+        predictions = data["predictions"]
+        names = [self.conversion_dict[prediction["class"]] for prediction in predictions]
+        rows, cols = self.grid_coordinates(data)
+        return BuildingTable.from_names(names, np.stack([rows, cols], axis=1))
 
+    def grid_coordinates(self, data):
+        """ Convert the top-left corner of every prediction to the 44x44 grid
+        :param data: json data containing the image and predictions
+        :type dict
+        :rtype array, array
+        :return: Rows and columns of every prediction's top-left corner
+        """
+        predictions = data["predictions"]
         diamond_length = math.sqrt(44**2 + 44**2)
         scale_x = data["image"]["width"] / diamond_length
         scale_y = data["image"]["height"] / diamond_length
 
-        center_x = self.find_edges(data)[0] + (self.find_edges(data)[2] - self.find_edges(data)[0]) / 2
-        center_y = self.find_edges(data)[1] + (self.find_edges(data)[3] - self.find_edges(data)[1]) / 2
-        center_x /= scale_x
-        center_y /= scale_y
-
-        for prediction in data["predictions"]:
-            name = self.conversion_dict[prediction["class"]]
-            cx, cy = prediction["x"], prediction["y"]
-            cx /= scale_x
-            cy /= scale_y
-            width, height = prediction["width"], prediction["height"]
-            width /= scale_x
-            height /= scale_y
-            x = cx - width
-            y = cy
-
-            rotated_coordinates = self.rotate_coordinates(y, x, center_y, center_x, 45)
-            rotated_coordinates = (rotated_coordinates[0] / diamond_length * 44, rotated_coordinates[1] / diamond_length * 44)
-            rotated_coordinates = (round(rotated_coordinates[0]), round(rotated_coordinates[1]))
-            Building.from_type(name, rotated_coordinates)
-
-        return building_list
+        min_x, min_y, max_x, max_y = self.find_edges(data)
+        center_x = (min_x + (max_x - min_x) / 2) / scale_x
+        center_y = (min_y + (max_y - min_y) / 2) / scale_y
+
+        cx = np.array([prediction["x"] for prediction in predictions], dtype=float) / scale_x
+        cy = np.array([prediction["y"] for prediction in predictions], dtype=float) / scale_y
+        width = np.array([prediction["width"] for prediction in predictions], dtype=float) / scale_x
+        x = cx - width
+        y = cy
+
+        # rotate_coordinates(y, x, center_y, center_x, 45) applied to every prediction
+        angle_rad = math.radians(45)
+        y_prime = y - center_y
+        x_prime = x - center_x
+        rows = y_prime * math.cos(angle_rad) + x_prime * math.sin(angle_rad) + center_y
+        cols = -y_prime * math.sin(angle_rad) + x_prime * math.cos(angle_rad) + center_x
+        rows = np.round(rows / diamond_length * 44).astype(np.int16)
+        cols = np.round(cols / diamond_length * 44).astype(np.int16)
+        return rows, cols
     
     def unrotate_coordinates(self, data, dragon_data):
         """ Unrotate the coordinates of the dragons to match the original image
@@ -0,0 +1,233 @@
+import os
+import queue
+import tempfile
+import threading
+from PIL import Image
+from core.board import build_board, find_dragon_positions, summarize_layout
+from core.model import ModelInference
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+# Marks the end of the frames flowing through a stage queue
+_DONE = object()
+
+
+class FrameError:
+    """ Carries the error of a single frame to the next stage, as opposed to an Exception which ends the stream. """
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_frames(source, sample_every=1):
+    """ Lazily reads frames from a video file, a directory of screenshots or a list of image paths.
+    :param source: path to a video or a directory, or a list of image paths
+    :param int sample_every: keep one frame out of every sample_every frames
+    :type str or list, int
+    :rtype generator
+    :return (frame index, PIL image) tuples, one frame held in memory at a time. A screenshot that cannot be read
+        comes out as (frame index, FrameError) so that it does not end the sequence.
+    """
+    if isinstance(source, (list, tuple)):
+        paths = source
+    elif not os.path.exists(source):
+        raise ValueError(f"Scouting source not found: {source}")
+    elif os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        paths = None
+
+    if paths is not None:
+        for index, path in enumerate(paths):
+            if index % sample_every == 0:
+                try:
+                    with Image.open(path) as image:
+                        frame = image.convert("RGB")
+                except Exception as error:
+                    frame = FrameError(error)
+                yield index, frame
+        return
+
+    if cv2 is None:
+        raise ValueError("Reading videos requires opencv-python. Please install it or pass a directory of images.")
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {source}")
+    try:
+        index = 0
+        while True:
+            # grab() skips decoding the frames that are not sampled
+            if not capture.grab():
+                break
+            if index % sample_every == 0:
+                success, frame = capture.retrieve()
+                if not success:
+                    break
+                yield index, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
+
+def difference_hash(image, hash_size=8):
+    """ Computes the difference hash of an image, a cheap perceptual hash that survives small rendering changes.
+    :param PIL.Image image: image to hash
+    :param int hash_size: the hash has hash_size * hash_size bits
+    :type PIL.Image, int
+    :rtype int
+    :return hash of the image
+    """
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def distinct_frames(frames, max_distance=6):
+    """ Drops frames that look the same as the last kept frame.
+    :param frames: (frame index, PIL image) tuples
+    :param int max_distance: frames whose hashes differ in at most this many bits are treated as duplicates
+    :type iterable, int
+    :rtype generator
+    :return (frame index, PIL image) tuples of distinct frames, frames that failed to read are passed through
+    """
+    last_hash = None
+    for index, image in frames:
+        if isinstance(image, FrameError):
+            yield index, image
+            continue
+        image_hash = difference_hash(image)
+        if last_hash is not None and bin(image_hash ^ last_hash).count("1") <= max_distance:
+            continue
+        last_hash = image_hash
+        yield index, image
+
+def stream_bases(source, sample_every=1, max_distance=6, max_in_flight=2, num_dragons=6, model=None):
+    """ Runs every distinct base of a scouting video or image sequence through detection, layout and placement.
+    Frames are read, detected and laid out on separate threads connected by bounded queues, so memory stays flat however long the input is.
+    :param source: path to a video or a directory, or a list of image paths
+    :param int sample_every: keep one frame out of every sample_every frames
+    :param int max_distance: frames whose hashes differ in at most this many bits are treated as duplicates
+    :param int max_in_flight: maximum number of frames waiting between two stages
+    :param int num_dragons: number of Electro Dragons to place
+    :param ModelInference model: model used for detection, defaults to the Roboflow model
+    :type str or list, int, int, int, int, ModelInference
+    :rtype generator
+    :return summarize_layout results with the frame index, in frame order, as soon as each one is ready.
+        A frame that fails to process yields {"frame": index, "error": message} and the stream carries on.
+    """
+    if sample_every < 1:
+        raise ValueError("sample_every must be at least 1.")
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1 to keep the queues bounded.")
+    if model is None:
+        model = ModelInference(os.getenv("ROBOFLOW_API_KEY"))
+    # Returning the generator rather than being one makes bad arguments fail at the call
+    return _stream_bases(source, sample_every, max_distance, max_in_flight, num_dragons, model)
+
+def _stream_bases(source, sample_every, max_distance, max_in_flight, num_dragons, model):
+    frame_queue = queue.Queue(max_in_flight)
+    output_queue = queue.Queue(max_in_flight)
+    result_queue = queue.Queue(max_in_flight)
+    stop = threading.Event()
+
+    def put(target, item):
+        # Gives up once the consumer has stopped so that no thread blocks forever
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(source_queue):
+        while not stop.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    # Each stage forwards whatever ends it, even a BaseException, so the consumer never waits on a dead thread
+    def read():
+        try:
+            for index, image in distinct_frames(iter_frames(source, sample_every), max_distance):
+                if not put(frame_queue, (index, image)):
+                    return
+            put(frame_queue, _DONE)
+        except BaseException as error:
+            put(frame_queue, error)
+
+    def detect():
+        try:
+            while True:
+                item = get(frame_queue)
+                if item is _DONE or isinstance(item, BaseException):
+                    put(output_queue, item)
+                    return
+                index, image = item
+                if not isinstance(image, FrameError):
+                    try:
+                        # The inference CLI reads the base from disk
+                        handle, path = tempfile.mkstemp(suffix=".jpg")
+                        os.close(handle)
+                        try:
+                            image.save(path)
+                            image = model.get_inference_output(path)
+                        finally:
+                            os.remove(path)
+                    except Exception as error:
+                        # One bad frame should not end the session
+                        image = FrameError(error)
+                if not put(output_queue, (index, image)):
+                    return
+        except BaseException as error:
+            put(output_queue, error)
+
+    def place():
+        try:
+            while True:
+                item = get(output_queue)
+                if item is _DONE or isinstance(item, BaseException):
+                    put(result_queue, item)
+                    return
+                index, output = item
+                if isinstance(output, FrameError):
+                    result = {"error": str(output.error)}
+                else:
+                    try:
+                        board, graph, output, table = build_board(output)
+                        chains, tiles, pixels = find_dragon_positions(board, graph, output, table, num_dragons)
+                        result = summarize_layout(output, table, chains, tiles, pixels)
+                    except Exception as error:
+                        result = {"error": str(error)}
+                result["frame"] = index
+                if not put(result_queue, result):
+                    return
+        except BaseException as error:
+            put(result_queue, error)
+
+    threads = [threading.Thread(target=stage, daemon=True) for stage in (read, detect, place)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = result_queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,329 @@
+""" Closed-loop load test for the Flask service.
+
+Starts the app in-process with a fake detector, so neither the inference CLI nor a Roboflow key is needed,
+and drives it with a fixed number of clients that each send their next request as soon as the last one returns.
+
+    python loadtest.py --concurrency 8 --duration 60 --mix upload=1,analyze=3 --latency 200
+    python loadtest.py --predictions recorded_output.json --report-interval 5
+"""
+import argparse
+import collections
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import http.client
+from PIL import Image
+from werkzeug.serving import make_server
+from app import app
+from core.imageTransform import ImageTransformer
+from core.model import ModelInference
+
+# Request kind -> (path, number of images per request)
+REQUESTS = {
+    "upload": ("/upload", 1),
+    "analyze": ("/api/analyze", 1),
+    "batch": ("/api/analyze", 4)
+}
+
+class FakeModelInference(ModelInference):
+    def __init__(self, outputs, latency=0.0, jitter=0.0):
+        """
+        Initializes a stand-in for the Roboflow model that replays recorded outputs.
+
+        :param list outputs: json outputs of the model, replayed in turn
+        :param float latency: seconds each inference takes
+        :param float jitter: maximum random seconds added to the latency
+        """
+        super().__init__(api_key=None)
+        self.outputs = itertools.cycle(outputs)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.jitter = jitter
+
+    def get_inference_output(self, image_path):
+        """ Returns the next recorded output after the configured latency
+        :param image_path: The path to base image, ignored
+        :type str
+        :rtype dict
+        :return: The json output of the model
+        """
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        with self.lock:
+            output = next(self.outputs)
+        return json.loads(json.dumps(output))
+
+
+def synthetic_output(seed, count=40, width=1000, height=800):
+    """ Creates a model output with randomly placed buildings
+    :param int seed: seed of the random layout
+    :param int count: number of predictions
+    :param int width: width of the base image
+    :param int height: height of the base image
+    :type int, int, int, int
+    :rtype dict
+    :return: json output in the format of the model
+    """
+    generator = random.Random(seed)
+    classes = list(ImageTransformer.conversion_dict)
+    predictions = [
+        {
+            "x": generator.uniform(width * 0.3, width * 0.7),
+            "y": generator.uniform(height * 0.3, height * 0.7),
+            "width": generator.uniform(20, 60),
+            "height": generator.uniform(20, 60),
+            "confidence": generator.uniform(0.3, 1.0),
+            "class": generator.choice(classes)
+        }
+        for _ in range(count)
+    ]
+    return {"inference_id": f"synthetic-{seed}", "image": {"width": width, "height": height}, "predictions": predictions}
+
+def synthetic_image(output):
+    """ Encodes a blank JPEG with the size recorded in a model output
+    :param dict output: json output of the model
+    :type dict
+    :rtype bytes
+    :return: JPEG bytes
+    """
+    image = Image.new("RGB", (output["image"]["width"], output["image"]["height"]), (90, 140, 60))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def encode_multipart(files):
+    """ Encodes files as a multipart/form-data body
+    :param list files: (field name, filename, bytes) tuples
+    :type list
+    :rtype bytes, str
+    :return: Body and content type
+    """
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for field, filename, content in files:
+        body.write(f"--{boundary}\r\n".encode())
+        body.write(f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode())
+        body.write(b"Content-Type: image/jpeg\r\n\r\n")
+        body.write(content)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+def current_rss():
+    """ Returns the resident set size of this process, which includes the server
+    :rtype int
+    :return: RSS in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not available on Windows, hence only imported when /proc is missing
+        import resource
+        # Peak RSS, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(values, fraction):
+    """ Returns the nearest-rank percentile of sorted values
+    :param list values: sorted values
+    :param float fraction: percentile between 0 and 1
+    :type list, float
+    :rtype float
+    :return: The percentile, None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(1, math.ceil(fraction * len(values)))
+    return values[rank - 1]
+
+def parse_mix(mix):
+    """ Parses a request mix such as "upload=1,analyze=3,batch=1"
+    :param str mix: comma separated kind=weight pairs
+    :type str
+    :rtype list, list
+    :return: Request kinds and their weights
+    """
+    kinds, weights = [], []
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in REQUESTS:
+            raise ValueError(f"Unknown request kind: {kind}")
+        kinds.append(kind)
+        weights.append(float(weight or 1))
+    return kinds, weights
+
+def run(concurrency, duration, mix, outputs, latency, jitter, report_interval, host="127.0.0.1", port=0):
+    """ Runs the load test and returns the measurements
+    :param int concurrency: number of clients
+    :param float duration: seconds to run for
+    :param str mix: request mix, see parse_mix
+    :param list outputs: json outputs replayed by the fake detector
+    :param float latency: seconds each fake inference takes
+    :param float jitter: maximum random seconds added to the latency
+    :param float report_interval: seconds between RSS samples
+    :param str host: host to serve on
+    :param int port: port to serve on, 0 picks a free one
+    :type int, float, str, list, float, float, float, str, int
+    :rtype dict
+    :return: latency percentiles, throughput, error rate and RSS samples
+    """
+    kinds, weights = parse_mix(mix)
+    images = [synthetic_image(output) for output in outputs]
+    work_folder = tempfile.mkdtemp(prefix="loadtest-")
+    # The app is shared with the caller, so its config is put back once the test is over
+    previous_config = {key: app.config.get(key) for key in ("MODEL", "UPLOAD_FOLDER", "OUTPUT_FOLDER")}
+    app.config.update(MODEL=FakeModelInference(outputs, latency, jitter), UPLOAD_FOLDER=work_folder, OUTPUT_FOLDER=work_folder)
+    # Keep the per-request access log out of the report, errors are still printed
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = None
+
+    lock = threading.Lock()
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    failures = collections.Counter()
+    rss = [(0.0, current_rss())]
+    start = time.perf_counter()
+    deadline = start + duration
+    finished = threading.Event()
+
+    def client(number):
+        generator = random.Random(number)
+        connection = http.client.HTTPConnection(host, server.server_port, timeout=60)
+        for request_number in itertools.count():
+            if time.perf_counter() >= deadline:
+                break
+            kind = generator.choices(kinds, weights)[0]
+            path, count = REQUESTS[kind]
+            files = [("file", f"client{number}_{request_number}_{i}.jpg", generator.choice(images)) for i in range(count)]
+            body, content_type = encode_multipart(files)
+            sent = time.perf_counter()
+            try:
+                connection.request("POST", path, body, {"Content-Type": content_type})
+                response = connection.getresponse()
+                content = response.read()
+                failure = None if response.status == 200 else f"HTTP {response.status}"
+                # Bases that fail to process are reported per file with a 200 response
+                if failure is None and path == "/api/analyze" and any("error" in result for result in json.loads(content)["results"]):
+                    failure = "error result"
+            except (OSError, ValueError, http.client.HTTPException) as error:
+                failure = type(error).__name__
+                connection.close()
+                connection = http.client.HTTPConnection(host, server.server_port, timeout=60)
+            elapsed = time.perf_counter() - sent
+            with lock:
+                latencies[kind].append(elapsed)
+                if failure is not None:
+                    errors[kind] += 1
+                    failures[f"{kind}: {failure}"] += 1
+        connection.close()
+
+    def sample_rss():
+        while not finished.wait(report_interval):
+            rss.append((time.perf_counter() - start, current_rss()))
+
+    try:
+        server = make_server(host, port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        clients = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        finished.set()
+        sampler.join()
+        rss.append((elapsed, current_rss()))
+    finally:
+        finished.set()
+        if server is not None:
+            server.shutdown()
+        app.config.update(previous_config)
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    def summarize(values, error_count):
+        values = sorted(values)
+        return {
+            "requests": len(values),
+            "errors": error_count,
+            "error_rate": error_count / len(values) if values else 0.0,
+            "throughput": len(values) / elapsed,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99)
+        }
+
+    return {
+        "duration": elapsed,
+        "concurrency": concurrency,
+        "total": summarize([value for kind in kinds for value in latencies[kind]], sum(errors.values())),
+        "by_kind": {kind: summarize(latencies[kind], errors[kind]) for kind in kinds},
+        "failures": dict(failures),
+        "rss": rss,
+        "rss_growth": rss[-1][1] - rss[0][1]
+    }
+
+def print_report(report):
+    """ Prints the measurements of a load test
+    :param dict report: result of run
+    :type dict
+    :rtype void
+    :return None
+    """
+    def milliseconds(value):
+        return "-" if value is None else f"{value * 1000:.1f}"
+
+    print(f"{report['concurrency']} clients for {report['duration']:.1f}s")
+    print(f"{'kind':<10}{'requests':>10}{'req/s':>10}{'errors':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["by_kind"].items()) + [("total", report["total"])]
+    for kind, stats in rows:
+        print(f"{kind:<10}{stats['requests']:>10}{stats['throughput']:>10.1f}{stats['error_rate']:>10.1%}"
+              f"{milliseconds(stats['p50']):>10}{milliseconds(stats['p95']):>10}{milliseconds(stats['p99']):>10}")
+    for failure, count in report["failures"].items():
+        print(f"  {count} x {failure}")
+    print("RSS over time:")
+    for seconds, size in report["rss"]:
+        print(f"  {seconds:>7.1f}s  {size / 2**20:>8.1f} MiB")
+    print(f"RSS growth: {report['rss_growth'] / 2**20:+.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop load test for the Flask service with a fake detector.")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of clients sending requests back to back")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run for")
+    parser.add_argument("--mix", default="upload=1,analyze=1", help="weighted request kinds out of upload, analyze and batch")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds each fake inference takes")
+    parser.add_argument("--jitter", type=float, default=0, help="maximum random milliseconds added to the latency")
+    parser.add_argument("--predictions", nargs="*", default=[], help="recorded model json outputs to replay")
+    parser.add_argument("--bases", type=int, default=8, help="number of synthetic bases when no predictions are given")
+    parser.add_argument("--report-interval", type=float, default=5, help="seconds between RSS samples")
+    parser.add_argument("--port", type=int, default=0, help="port to serve on, 0 picks a free one")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    args = parser.parse_args()
+
+    outputs = []
+    for path in args.predictions:
+        with open(path) as file:
+            outputs.append(json.load(file))
+    if not outputs:
+        outputs = [synthetic_output(seed) for seed in range(args.bases)]
+
+    report = run(args.concurrency, args.duration, args.mix, outputs, args.latency / 1000, args.jitter / 1000,
+                 args.report_interval, port=args.port)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,20 @@
-from core.board import print_board, initialize_board, process_dragons
-from core.building import Building
+from core.board import print_board, initialize_board, process_dragons, find_dragon_positions, summarize_layout
 
-def process_image(base_image_path, output_image_path):
-    board, graph, output = initialize_board(base_image_path)
-    process_dragons(board, graph, output, Building.building_list, base_image_path, output_image_path)
+def process_image(base_image_path, output_image_path, model=None):
+    board, graph, output, table = initialize_board(base_image_path, model)
+    process_dragons(board, graph, output, table, base_image_path, output_image_path)
+
+def analyze_image(base_image_path, model=None):
+    """ Detects the base and places the Electro Dragons without rendering an output image.
+    :param str base_image_path: path to the base image
+    :param ModelInference model: model used for detection, defaults to the Roboflow model
+    :type str, ModelInference
+    :rtype dict
+    :return buildings, chains, grid dragon tiles, pixel dragon coordinates and dropped detections, ready to be serialized as json
+    """
+    board, graph, output, table = initialize_board(base_image_path, model)
+    chains, tiles, pixels = find_dragon_positions(board, graph, output, table)
+    return summarize_layout(output, table, chains, tiles, pixels)
 
 def main():
     base_image_path = "assets/COC_24.webp"
@@ -11,4 +22,4 @@ def main():
     process_image(base_image_path, output_image_path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()